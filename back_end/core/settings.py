@@ -8,6 +8,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Path to the 'data' folder generated by our offline scripts
 DATA_DIR = os.path.join(BASE_DIR.parent, 'data')
 
+# Internal nginx location mapped to DATA_DIR/books (e.g. '/protected-books/').
+# When set, BookContentView answers with X-Accel-Redirect and nginx streams the file.
+BOOKS_ACCEL_REDIRECT = os.environ.get('BOOKS_ACCEL_REDIRECT', '')
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-dev-key-change-in-prod'
 
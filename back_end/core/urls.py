@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from gutenberg_api import views
-from core.views import HomeView
+from core.views import HomeView, HealthView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,6 +9,9 @@ urlpatterns = [
     # --- The Frontend ---
     path('', HomeView.as_view(), name='home'),
 
+    # Readiness probe (run_server.py)
+    path('healthz', HealthView.as_view(), name='healthz'),
+
     # API Endpoints
     path('api/search',
          views.SimpleSearchView.as_view(), name='search'),
@@ -16,6 +19,9 @@ urlpatterns = [
     path('api/search/advanced',
          views.AdvancedSearchView.as_view(), name='search_advanced'),
 
+    path('api/book/suggestions',
+         views.BatchSuggestionView.as_view(), name='suggestions_batch'),
+
     path('api/book/<int:book_id>/suggestions',
          views.SuggestionView.as_view(), name='suggestions'),
 
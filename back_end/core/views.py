@@ -1,4 +1,12 @@
+from django.http import HttpResponse
+from django.views import View
 from django.views.generic import TemplateView
 
 class HomeView(TemplateView):
-    template_name = "index.html"
\ No newline at end of file
+    template_name = "index.html"
+
+class HealthView(View):
+    """Readiness probe: answers GET/HEAD without touching Elasticsearch."""
+
+    def get(self, request):
+        return HttpResponse(status=200)
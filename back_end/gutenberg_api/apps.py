@@ -1,47 +1,165 @@
 import os
+import pickle
+import sys
+import numpy as np
 import pandas as pd
 from django.apps import AppConfig
 from django.conf import settings
 
+# Narrow schemas of the offline outputs (read through pyarrow)
+RANK_DTYPES = {'id': 'int32', 'pagerank': 'float32', 'closeness': 'float32'}
+GRAPH_DTYPES = {'source': 'int32', 'target': 'int32'}
+# Offline outputs are Parquet; CSV is still read for older data dirs
+DATA_EXTENSIONS = ('.parquet', '.csv')
+# Bumped whenever the in-memory layout of a snapshot changes
+SNAPSHOT_VERSION = 2
+
+
+def find_data_file(name):
+    """Path of the first existing <DATA_DIR>/<name>.parquet|.csv, else None."""
+    for ext in DATA_EXTENSIONS:
+        path = os.path.join(settings.DATA_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_table(path, dtypes):
+    """Reads the needed columns of an offline output with narrow dtypes."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=list(dtypes)).astype(dtypes)
+    return pd.read_csv(path, engine='pyarrow', usecols=list(dtypes), dtype=dtypes)
+
+
+def is_server_process():
+    """
+    True in processes that serve requests. manage.py commands (migrate,
+    shell, check...) skip the data loading, except the runserver child
+    (RUN_MAIN, not the auto-reloader). ASGI servers such as uvicorn
+    import the app once per worker.
+    """
+    if os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin'):
+        return True
+    return (len(sys.argv) > 1 and sys.argv[1] == 'runserver'
+            and os.environ.get('RUN_MAIN') == 'true')
+
 
 class GutenbergApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gutenberg_api'
 
     # Global in-memory storage for indexes
-    # {book_id: {'pagerank': float, 'closeness': float}}
-    book_ranks = {}
-    # {book_id: [neighbor_id_1, neighbor_id_2...]}
-    book_graph = {}
+    # Ranks as contiguous arrays (row i <-> ranks_ids[i])
+    ranks_ids = np.empty(0, dtype=np.int32)
+    pagerank = np.empty(0, dtype=np.float32)
+    closeness = np.empty(0, dtype=np.float32)
+    # PageRank indexed directly by book_id (ids are dense, < ~80k)
+    pagerank_flat = np.zeros(0, dtype=np.float32)
+    # Jaccard graph in CSR layout: neighbors of book_id are
+    # graph_indices[graph_indptr[book_id]:graph_indptr[book_id + 1]]
+    graph_indptr = np.zeros(1, dtype=np.int32)
+    graph_indices = np.empty(0, dtype=np.int32)
+    # {book_id: {'id', 'title', 'author', 'image_url'}} (immutable after indexing)
+    book_meta = {}
 
     def ready(self):
-        """Loads CSV data into memory when Django starts."""
-        # Prevent running twice with auto-reloader
-        if os.environ.get('RUN_MAIN', None) != 'true':
+        """Loads the offline outputs into memory when Django starts."""
+        if not is_server_process():
             return
         # 1. Load Ranks
-        rank_path = os.path.join(settings.DATA_DIR, 'book_ranks.csv')
-        if os.path.exists(rank_path):
+        rank_path = find_data_file('book_ranks')
+        if rank_path:
             try:
-                df = pd.read_csv(rank_path)
-                # Dict for O(1) access: id -> row_dict
-                self.book_ranks = df.set_index('id').to_dict('index')
-                print(f"Loaded {len(self.book_ranks)} ranks.")
+                snapshot = self.load_snapshot(rank_path)
+                if snapshot is None:
+                    df = read_table(rank_path, RANK_DTYPES)
+                    snapshot = (df['id'].to_numpy(),
+                                df['pagerank'].to_numpy(),
+                                df['closeness'].to_numpy())
+                    self.save_snapshot(rank_path, snapshot)
+                self.ranks_ids, self.pagerank, self.closeness = snapshot
+                # Flat array for O(1) access without hashing: id -> pagerank
+                max_id = int(self.ranks_ids.max()) if len(self.ranks_ids) else -1
+                self.pagerank_flat = np.zeros(max_id + 1, dtype=np.float32)
+                self.pagerank_flat[self.ranks_ids] = self.pagerank
+                print(f"Loaded {len(self.ranks_ids)} ranks.")
             except Exception as e:
                 print(f"Error loading ranks: {e}")
         else:
-            print(f"Warning: {rank_path} missing.")
+            print(f"Warning: book_ranks.parquet missing in {settings.DATA_DIR}.")
 
-        # 2. Load Graph (Adjacency List)
-        graph_path = os.path.join(settings.DATA_DIR, 'book_graph.csv')
-        if os.path.exists(graph_path):
+        # 2. Load Graph (CSR adjacency)
+        graph_path = find_data_file('book_graph')
+        if graph_path:
             try:
-                df = pd.read_csv(graph_path)
-                # Group by source to get neighbors
-                grouped = df.groupby('source')['target'].apply(list)
-                self.book_graph = grouped.to_dict()
-                print(f"Loaded graph for {len(self.book_graph)} books.")
+                snapshot = self.load_snapshot(graph_path)
+                if snapshot is None:
+                    df = read_table(graph_path, GRAPH_DTYPES)
+                    # Sort edges by source (stable: keeps file neighbor order)
+                    src = df['source'].to_numpy()
+                    tgt = df['target'].to_numpy()
+                    order = np.argsort(src, kind='stable')
+                    # indptr[i + 1] - indptr[i] = out-degree of book i
+                    max_id = int(src.max()) if len(src) else -1
+                    indptr = np.zeros(max_id + 2, dtype=np.int32)
+                    np.cumsum(np.bincount(src, minlength=max_id + 1), out=indptr[1:])
+                    snapshot = (indptr, tgt[order])
+                    self.save_snapshot(graph_path, snapshot)
+                self.graph_indptr, self.graph_indices = snapshot
+                n_books = np.count_nonzero(np.diff(self.graph_indptr))
+                print(f"Loaded graph for {n_books} books.")
             except Exception as e:
                 print(f"Error loading graph: {e}")
         else:
-            print(f"Warning: {graph_path} missing.")
\ No newline at end of file
+            print(f"Warning: book_graph.parquet missing in {settings.DATA_DIR}.")
+
+        # 3. Load display metadata of every indexed book (single ES scan)
+        self.load_book_meta()
+
+    def neighbors(self, book_id):
+        """Neighbor ids of a book (view into graph_indices, empty if unknown)."""
+        if not 0 <= book_id < len(self.graph_indptr) - 1:
+            return self.graph_indices[:0]
+        return self.graph_indices[self.graph_indptr[book_id]:self.graph_indptr[book_id + 1]]
+
+    @staticmethod
+    def load_snapshot(data_path):
+        """Returns the pickled parse of a data file if it is newer than the file."""
+        pkl_path = f"{data_path}.v{SNAPSHOT_VERSION}.pkl"
+        if (not os.path.exists(pkl_path)
+                or os.path.getmtime(pkl_path) < os.path.getmtime(data_path)):
+            return None
+        try:
+            with open(pkl_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring stale snapshot {pkl_path}: {e}")
+            return None
+
+    @staticmethod
+    def save_snapshot(data_path, data):
+        """Pickles the parsed data next to its file (atomic rename, best effort)."""
+        pkl_path = f"{data_path}.v{SNAPSHOT_VERSION}.pkl"
+        tmp_path = f"{pkl_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=5)
+            os.replace(tmp_path, pkl_path)
+        except OSError as e:
+            print(f"Could not write snapshot {pkl_path}: {e}")
+
+    def load_book_meta(self):
+        """Hydrates book_meta from Elasticsearch so views only fetch ids."""
+        from elasticsearch_dsl import Search
+        from .views import ES_CLIENT, ES_INDEX, DISPLAY_FIELDS, book_summary
+
+        try:
+            s = Search(using=ES_CLIENT, index=ES_INDEX)
+            s = s.source(DISPLAY_FIELDS).params(scroll='2m')
+            self.book_meta = {
+                hit.gutenberg_id: book_summary(hit.to_dict())
+                for hit in s.scan()
+            }
+            print(f"Loaded metadata for {len(self.book_meta)} books.")
+        except Exception as e:
+            print(f"Error loading book metadata: {e}")
@@ -0,0 +1,18 @@
+from rest_framework import serializers
+
+
+class RankedBookSerializer(serializers.BaseSerializer):
+    """
+    Presentation of a calculate_ranking row.
+    Ranking works on raw floats, rounding/formatting only happens here.
+    """
+
+    def to_representation(self, book):
+        data = {**book, 'score': round(book['score'], 4)}
+        details = book.get('details')
+        if details is not None:
+            data['details'] = {
+                'tf_idf': round(details['tf_idf'], 2),
+                'pagerank': f"{details['pagerank']:.6f}"
+            }
+        return data
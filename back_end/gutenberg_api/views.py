@@ -1,17 +1,108 @@
 import os
+import re
+import json
+import threading
+import numpy as np
+import cachetools
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from elasticsearch_dsl import Search
-from elasticsearch import Elasticsearch
+from elasticsearch_dsl import Search, MultiSearch, AsyncSearch, AsyncMultiSearch, Q
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+
+from .serializers import RankedBookSerializer
 
 # ES Client configuration
 ES_URL = os.environ.get("ES_HOST", "http://localhost:9200")
 ES_CLIENT = Elasticsearch(ES_URL)
+# Used by the async views (requires an ASGI server, see docker-compose)
+ES_ASYNC_CLIENT = AsyncElasticsearch(ES_URL)
 ES_INDEX = "gutenberg_books"
 
+# Pagination (delegated to ES via from/size)
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+# ES index.max_result_window: from + size must stay below it
+MAX_RESULT_WINDOW = 10000
+
+# Fields actually rendered by the frontend (never fetch 'content')
+DISPLAY_FIELDS = ['gutenberg_id', 'title', 'author', 'image_url']
+
+# Suggestions
+MAX_SUGGESTIONS = 10
+MAX_BATCH_BOOKS = 50
+
+# Book content streaming
+CONTENT_CHUNK_SIZE = 64 * 1024
+
+# Author buckets returned by AdvancedSearchView with ?facets=1
+MAX_AUTHOR_FACETS = 10
+
+# RegEx shapes that map to cheaper ES queries (content terms are lowercased)
+LITERAL_RE = re.compile(r'^[a-z0-9]+$')             # frankenstein
+PREFIX_RE = re.compile(r'^([a-z0-9]+)\.\*$')         # fran.*
+CONTAINS_RE = re.compile(r'^\.\*([a-z0-9]+)\.\*$')   # .*hugo.* (word lookup)
+# Fallback regexp: no ANYSTRING/INTERSECTION operators, bounded automaton
+REGEX_FLAGS = "COMPLEMENT|INTERVAL"
+REGEX_MAX_STATES = 5000
+
+# Search hints: stick to the same shard copy and opt into the shard
+# request cache (ES only caches size > 0 searches on explicit request)
+SEARCH_PARAMS = {'preference': '_local', 'request_cache': True}
+
+# In-process cache of ranked payloads: (view, query, page, size) -> payload
+RESULT_CACHE = cachetools.TTLCache(maxsize=1024, ttl=300)
+RESULT_CACHE_LOCK = threading.Lock()
+
+
+def book_summary(source):
+    """Display dict of a book, built from its ES _source."""
+    return {
+        'id': source.get('gutenberg_id'),
+        'title': source.get('title'),
+        'author': source.get('author'),
+        'image_url': source.get('image_url')
+    }
+
+
+def cache_found_books(book_meta, docs):
+    """Stores the summaries of an mget response into the book cache."""
+    for doc in docs['docs']:
+        if doc.get('found'):
+            summary = book_summary(doc['_source'])
+            book_meta[summary['id']] = summary
+
+
+def lookup_books(book_ids):
+    """
+    Returns the {book_id: summary} cache loaded at startup (AppConfig),
+    filling misses (books indexed after boot) with a single ES mget.
+    """
+    book_meta = apps.get_app_config('gutenberg_api').book_meta
+    missing = [book_id for book_id in book_ids if book_id not in book_meta]
+    if missing:
+        docs = ES_CLIENT.mget(index=ES_INDEX, ids=missing, source=DISPLAY_FIELDS)
+        cache_found_books(book_meta, docs)
+    return book_meta
+
+
+async def alookup_books(book_ids):
+    """Async variant of lookup_books (misses fetched with the async client)."""
+    book_meta = apps.get_app_config('gutenberg_api').book_meta
+    missing = [book_id for book_id in book_ids if book_id not in book_meta]
+    if missing:
+        docs = await ES_ASYNC_CLIENT.mget(index=ES_INDEX, ids=missing,
+                                          source=DISPLAY_FIELDS)
+        cache_found_books(book_meta, docs)
+    return book_meta
+
 
 class BaseSearchView(APIView):
     """Base class for shared ranking logic."""
@@ -20,54 +111,105 @@ class BaseSearchView(APIView):
         """Retrieve in-memory data from AppConfig."""
         return apps.get_app_config('gutenberg_api')
 
-    def calculate_ranking(self, es_results):
+    def get_pagination(self, request):
+        """
+        Reads ?page=&size= from the query string.
+        Raises ValueError on non-integer or out-of-range values.
+        """
+        page = int(request.query_params.get('page', 1))
+        size = min(int(request.query_params.get('size', DEFAULT_PAGE_SIZE)),
+                   MAX_PAGE_SIZE)
+        if page < 1 or size < 1:
+            raise ValueError("'page' and 'size' must be positive integers")
+        if page * size > MAX_RESULT_WINDOW:
+            raise ValueError(f"'page' * 'size' must not exceed {MAX_RESULT_WINDOW}")
+        return page, size
+
+    def cache_key(self, query, page, size, *extra):
+        return (self.__class__.__name__, query.lower(), page, size, *extra)
+
+    def get_cached(self, key):
+        # TTLCache expires entries on read too, so reads are locked as well
+        with RESULT_CACHE_LOCK:
+            return RESULT_CACHE.get(key)
+
+    def set_cached(self, key, payload):
+        with RESULT_CACHE_LOCK:
+            RESULT_CACHE[key] = payload
+
+    def paginate(self, s, page, size):
+        """
+        Applies ES-side pagination. Only ids come back from ES, display
+        fields are served from the in-memory book cache.
+        """
+        s = s.extra(from_=(page - 1) * size, size=size)
+        return s.source(['gutenberg_id'])
+
+    def wants_details(self, request):
+        """Per-hit score breakdown is only returned with ?debug=1."""
+        return request.query_params.get('debug') == '1'
+
+    def calculate_ranking(self, es_results, limit=None, details=False):
         """
         Merges ES score (TF-IDF) with PageRank (Centrality).
         Formula: Score = (Norm_ES * 0.7) + (Norm_PR * 0.3)
+        Scoring and sorting are vectorized; dicts are only built for the
+        top 'limit' hits. Scores are raw floats (see RankedBookSerializer).
         """
-        book_ranks = self.get_app_data().book_ranks
-        ranked_results = []
+        app_data = self.get_app_data()
+        pagerank_flat = app_data.pagerank_flat
+        hits = list(es_results)
+        n = len(hits)
+        if n == 0:
+            return []
+
+        es_scores = np.fromiter((hit.meta.score for hit in hits),
+                                dtype=np.float32, count=n)
+        ids = np.fromiter((hit.gutenberg_id for hit in hits),
+                          dtype=np.int64, count=n)
+
+        # Get offline scores (default to 0 if missing)
+        valid = (ids >= 0) & (ids < len(pagerank_flat))
+        pageranks = np.zeros(n, dtype=np.float32)
+        pageranks[valid] = pagerank_flat[ids[valid]]
 
         # Find max ES score for normalization
-        max_es = max((hit.meta.score for hit in es_results), default=1.0)
+        max_es = es_scores.max()
         if max_es == 0:
             max_es = 1.0
 
-        for hit in es_results:
-            book_id = hit.gutenberg_id
-            es_score = hit.meta.score
-
-            # Get offline scores (default to 0 if missing)
-            stats = book_ranks.get(book_id, {'pagerank': 0, 'closeness': 0})
-            pagerank = stats['pagerank']
-
-            # Normalize and combine
-            # Multiply PR by 50 to bring it to a scale comparable to TF-IDF
-            norm_es = es_score / max_es
-            norm_pr = pagerank * 50
-
-            final_score = (norm_es * 0.7) + (norm_pr * 0.3)
-
-            ranked_results.append({
-                'id': book_id,
-                'title': hit.title,
-                'author': hit.author,
-                'image_url': hit.image_url,
-                'score': round(final_score, 4),
-                'details': {
-                    'tf_idf': round(es_score, 2),
-                    'pagerank': f"{pagerank:.6f}"
-                }
-            })
-
-        # Sort by final score descending
-        ranked_results.sort(key=lambda x: x['score'], reverse=True)
+        # Normalize and combine
+        # Multiply PR by 50 to bring it to a scale comparable to TF-IDF
+        final_scores = (es_scores / max_es) * 0.7 + (pageranks * 50) * 0.3
+
+        if pageranks.any():
+            # Sort by final score descending (stable: ties keep ES order)
+            order = np.argsort(-final_scores, kind='stable')[:limit]
+        else:
+            # Cold graph: the fusion is a constant rescale of the ES score,
+            # so ES order (score descending) is already the final order
+            order = np.arange(n if limit is None else min(n, limit))
+
+        book_ids = ids[order].tolist()
+        scores = final_scores[order].tolist()
+        books = lookup_books(book_ids)
+
+        ranked_results = [
+            {**(books.get(book_id) or book_summary({'gutenberg_id': book_id})),
+             'score': score}
+            for book_id, score in zip(book_ids, scores)
+        ]
+        if details:
+            for result, tf_idf, pagerank in zip(ranked_results,
+                                                es_scores[order].tolist(),
+                                                pageranks[order].tolist()):
+                result['details'] = {'tf_idf': tf_idf, 'pagerank': pagerank}
         return ranked_results
 
 
 class SimpleSearchView(BaseSearchView):
     """
-    GET /api/search?q=keyword
+    GET /api/search?q=keyword&page=1&size=20[&debug=1]
     Full-text search using ElasticSearch multi_match.
     """
 
@@ -76,85 +218,254 @@ class SimpleSearchView(BaseSearchView):
         if not query:
             return Response({"error": "Missing 'q' parameter"}, status=400)
 
+        try:
+            page, size = self.get_pagination(request)
+        except ValueError as e:
+            return Response({"error": f"Invalid pagination: {str(e)}"}, status=400)
+
+        details = self.wants_details(request)
+
+        key = self.cache_key(query, page, size, details)
+        cached = self.get_cached(key)
+        if cached is not None:
+            return Response(cached)
+
         s = Search(using=ES_CLIENT, index=ES_INDEX)
         # Search in title (boosted), author, and content
         s = s.query("multi_match", query=query,
                     fields=['title^3', 'author^2', 'content'])
+        s = self.paginate(s, page, size)
+        s = s.params(**SEARCH_PARAMS)
+
+        try:
+            response = s.execute()
+        except Exception as e:
+            return Response({"error": f"Search Error: {str(e)}"}, status=400)
 
-        response = s[0:50].execute()
-        final_results = self.calculate_ranking(response)
+        final_results = self.calculate_ranking(response, limit=size, details=details)
 
-        return Response({
-            "count": len(final_results),
-            "results": final_results[:20]
-        })
+        payload = {
+            "count": response.hits.total.value,
+            "page": page,
+            "results": RankedBookSerializer(final_results, many=True).data
+        }
+        self.set_cached(key, payload)
+        return Response(payload)
 
 
 class AdvancedSearchView(BaseSearchView):
     """
-    GET /api/search/advanced?q=RegEx
-    RegEx search on book content.
+    GET /api/search/advanced?q=RegEx&page=1&size=20[&facets=1][&debug=1]
+    RegEx search on book content, optionally with author facets.
     """
 
+    def build_query(self, regex):
+        """
+        Picks the cheapest ES query equivalent to the (lowercased) regex.
+        Only true regexes go through the Lucene RegExp automaton.
+        Every shape is constant-score, so the PageRank blend of
+        calculate_ranking does not depend on how the regex was written.
+        """
+        return Q("constant_score", filter=self.match_query(regex))
+
+    def match_query(self, regex):
+        if LITERAL_RE.match(regex):
+            return Q("term", content=regex)
+
+        match = PREFIX_RE.match(regex)
+        if match:
+            return Q("prefix", content=match.group(1))
+
+        # A leading wildcard walks the term dictionary like the regexp would:
+        # unanchored words are looked up in the postings instead
+        match = CONTAINS_RE.match(regex)
+        if match:
+            return Q("match_phrase", content=match.group(1))
+
+        return Q("regexp", content={
+            "value": regex,
+            "flags": REGEX_FLAGS,
+            "max_determinized_states": REGEX_MAX_STATES
+        })
+
+    def build_facets(self, query):
+        """size=0 aggregation search: cached by ES for every page of a regex."""
+        s = Search().query(query).extra(size=0, track_total_hits=False)
+        s.aggs.bucket('authors', 'terms', field='author.keyword',
+                      size=MAX_AUTHOR_FACETS)
+        return s.params(**SEARCH_PARAMS)
+
     def get(self, request):
         regex = request.query_params.get('q', '').strip()
         if not regex:
             return Response({"error": "Missing 'q' parameter"}, status=400)
 
+        try:
+            page, size = self.get_pagination(request)
+        except ValueError as e:
+            return Response({"error": f"Invalid pagination: {str(e)}"}, status=400)
+
         regex = regex.lower()
+        with_facets = request.query_params.get('facets') == '1'
+
+        details = self.wants_details(request)
+
+        key = self.cache_key(regex, page, size, with_facets, details)
+        cached = self.get_cached(key)
+        if cached is not None:
+            return Response(cached)
 
+        query = self.build_query(regex)
         s = Search(using=ES_CLIENT, index=ES_INDEX)
-        s = s.query("regexp", content={"value": regex, "flags": "ALL"})
+        s = s.query(query)
+        s = self.paginate(s, page, size)
+        # Regex queries are expensive: let the ES shard request cache keep them
+        s = s.params(**SEARCH_PARAMS)
 
         try:
-            response = s[0:50].execute()
+            if with_facets:
+                # Hits and facets as two separately cacheable searches
+                # (the facet one does not depend on the page), one roundtrip
+                ms = MultiSearch(using=ES_CLIENT, index=ES_INDEX)
+                ms = ms.add(s).add(self.build_facets(query))
+                response, facets_response = ms.execute()
+            else:
+                response = s.execute()
         except Exception as e:
             return Response({"error": f"Search Error: {str(e)}"}, status=400)
 
-        final_results = self.calculate_ranking(response)
-
-        return Response({
-            "count": len(final_results),
-            "results": final_results
-        })
-
-
-class SuggestionView(APIView):
+        final_results = self.calculate_ranking(response, limit=size, details=details)
+
+        payload = {
+            "count": response.hits.total.value,
+            "page": page,
+            "results": RankedBookSerializer(final_results, many=True).data
+        }
+        if with_facets:
+            payload["facets"] = {
+                "authors": [
+                    {"author": bucket.key, "count": bucket.doc_count}
+                    for bucket in facets_response.aggregations.authors.buckets
+                ]
+            }
+        self.set_cached(key, payload)
+        return Response(payload)
+
+
+class SuggestionView(View):
     """
     GET /api/book/<id>/suggestions
     Returns neighbors from the Jaccard graph.
+    Async view: the ES roundtrip does not hold a server worker (ASGI).
     """
 
-    def get(self, request, book_id):
-        graph = apps.get_app_config('gutenberg_api').book_graph
+    async def format_suggestions(self, response):
+        book_ids = [hit.gutenberg_id for hit in response]
+        books = await alookup_books(book_ids)
+        return [books.get(book_id) or book_summary({'gutenberg_id': book_id})
+                for book_id in book_ids]
+
+    async def get(self, request, book_id):
+        app_data = apps.get_app_config('gutenberg_api')
 
-        # 1. Get neighbors IDs from memory
-        neighbor_ids = graph.get(book_id, [])
+        # 1. Get neighbors IDs from memory (CSR slice)
+        neighbor_ids = app_data.neighbors(book_id)
 
-        if not neighbor_ids:
-            return Response({"results": []})
+        if not len(neighbor_ids):
+            return JsonResponse({"results": []})
 
         # 2. Fetch details from ElasticSearch (Multi-Get)
-        s = Search(using=ES_CLIENT, index=ES_INDEX)
-        s = s.filter("terms", gutenberg_id=neighbor_ids)
-        response = s[0:10].execute()
+        s = AsyncSearch(using=ES_ASYNC_CLIENT, index=ES_INDEX)
+        s = s.filter("terms", gutenberg_id=neighbor_ids.tolist()).source(['gutenberg_id'])
+        response = await s[0:MAX_SUGGESTIONS].execute()
+
+        return JsonResponse({"results": await self.format_suggestions(response)})
 
-        suggestions = [{
-            'id': hit.gutenberg_id,
-            'title': hit.title,
-            'author': hit.author,
-            'image_url': hit.image_url
-        } for hit in response]
 
-        return Response({"results": suggestions})
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchSuggestionView(SuggestionView):
+    """
+    POST /api/book/suggestions  {"book_ids": [1, 2, ...]}
+    Batched variant: one ES _msearch roundtrip for all requested books.
+    """
+    http_method_names = ['post', 'options']
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'null')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+        book_ids = data.get('book_ids') if isinstance(data, dict) else None
+        if not isinstance(book_ids, list) or not book_ids:
+            return JsonResponse({"error": "Missing 'book_ids' list"}, status=400)
+        if len(book_ids) > MAX_BATCH_BOOKS:
+            return JsonResponse(
+                {"error": f"At most {MAX_BATCH_BOOKS} 'book_ids' per request"},
+                status=400)
+        try:
+            book_ids = [int(b) for b in book_ids]
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "'book_ids' must be integers"}, status=400)
+
+        app_data = apps.get_app_config('gutenberg_api')
+        results = {book_id: [] for book_id in book_ids}
+
+        # 1. One sub-search per book that has neighbors
+        ms = AsyncMultiSearch(using=ES_ASYNC_CLIENT, index=ES_INDEX)
+        queried_ids = []
+        for book_id in results:
+            neighbor_ids = app_data.neighbors(book_id)
+            if not len(neighbor_ids):
+                continue
+            ms = ms.add(AsyncSearch()
+                        .filter("terms", gutenberg_id=neighbor_ids.tolist())
+                        .source(['gutenberg_id'])[0:MAX_SUGGESTIONS])
+            queried_ids.append(book_id)
+
+        # 2. Single _msearch roundtrip, responses come back in order
+        if queried_ids:
+            responses = await ms.execute()
+            for book_id, response in zip(queried_ids, responses):
+                results[book_id] = await self.format_suggestions(response)
+
+        return JsonResponse({"results": results})
 
 
 class BookContentView(APIView):
     """
     GET /api/book/<id>/content
-    Reads the local .txt file and returns its content.
+    Streams the local .txt file as text/plain: served by nginx when
+    BOOKS_ACCEL_REDIRECT is set, otherwise streamed in 64 KiB chunks.
+    GET /api/book/<id>/content?format=json
+    Legacy JSON envelope, streamed in 64 KiB chunks.
+    Both streams are async iterators: under ASGI, Django buffers a sync
+    iterator entirely before sending it.
     """
 
+    async def read_chunks(self, f):
+        """Yields the chunks of f, each read in a worker thread. Closes f."""
+        read = sync_to_async(f.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(CONTENT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def stream_json(self, book_id, f):
+        """Yields {"id": ..., "content": "..."} without loading the whole book."""
+        try:
+            yield f'{{"id": {book_id}, "content": "'
+            async for chunk in self.read_chunks(f):
+                # json.dumps escapes the chunk, strip the surrounding quotes
+                yield json.dumps(chunk)[1:-1]
+            yield '"}'
+        finally:
+            f.close()
+
     def get(self, request, book_id):
         # Construct absolute path to the book file
         file_path = os.path.join(settings.DATA_DIR, 'books', f"{book_id}.txt")
@@ -162,13 +473,23 @@ class BookContentView(APIView):
         if not os.path.exists(file_path):
             return Response({"error": "Book text not found locally."}, status=404)
 
-        try:
-            # Read the file
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+        if request.query_params.get('format') == 'json':
+            f = open(file_path, 'r', encoding='utf-8')
+            return StreamingHttpResponse(self.stream_json(book_id, f),
+                                         content_type='application/json')
 
-            # Return as JSON (safer than raw text for frontend handling)
-            return Response({"id": book_id, "content": content})
+        # Production: let nginx stream the file (internal location)
+        if settings.BOOKS_ACCEL_REDIRECT:
+            response = HttpResponse(content_type='text/plain; charset=utf-8')
+            response['X-Accel-Redirect'] = f"{settings.BOOKS_ACCEL_REDIRECT}{book_id}.txt"
+            return response
 
-        except Exception as e:
-            return Response({"error": f"Error reading file: {str(e)}"}, status=500)
\ No newline at end of file
+        try:
+            size = os.path.getsize(file_path)
+            f = open(file_path, 'rb')
+        except OSError as e:
+            return Response({"error": f"Error reading file: {str(e)}"}, status=500)
+        response = StreamingHttpResponse(self.read_chunks(f),
+                                         content_type='text/plain; charset=utf-8')
+        response['Content-Length'] = str(size)
+        return response
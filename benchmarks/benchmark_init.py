@@ -1,5 +1,6 @@
 import time
 import os
+import argparse
 import subprocess
 import sys
 import shutil
@@ -9,17 +10,24 @@ import requests
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts import config
 
+# Keep-alive session for the readiness probes
+SESSION = requests.Session()
+
 
 def get_dir_size(path):
     """Calculates total size of a directory in MB."""
     total_size = 0
     if not os.path.exists(path):
         return 0
-    for dirpath, dirnames, filenames in os.walk(path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            if not os.path.islink(fp):
-                total_size += os.path.getsize(fp)
+    # scandir reuses the dirent info from readdir: one stat per file
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total_size += entry.stat(follow_symlinks=False).st_size
     return total_size / (1024 * 1024)  # Convert to MB
 
 
@@ -40,6 +48,11 @@ def clean_data_directory():
     # 2. Supprimer les fichiers de production spécifiques
     files_to_delete = [
         config.PATHS["metadata"],
+        config.PATHS["metadata_log"],
+        config.PATHS["graph_parquet"],
+        config.PATHS["ranks_parquet"],
+        config.PATHS["terms_cache"],
+        config.PATHS["indexed_ids_cache"],
         config.PATHS["graph_csv"],
         config.PATHS["ranks_csv"]
     ]
@@ -64,32 +77,41 @@ def wipe_docker_volume():
         sys.exit(1)
 
 
-def wait_for_elasticsearch():
-    """Waits for ES to be responsive."""
-    url = config.ELASTIC["host"]
-    print(f"Waiting for Elasticsearch at {url}...")
-    for _ in range(60):  # Try for 60 seconds
+def wait_for_elasticsearch(timeout=60, max_delay=2.0):
+    """
+    Waits for ES to be responsive (cluster at least yellow).
+    HEAD polls with exponential backoff, ES itself waits up to 1s per poll.
+    """
+    url = f"{config.ELASTIC['host']}/_cluster/health?wait_for_status=yellow&timeout=1s"
+    print(f"Waiting for Elasticsearch at {config.ELASTIC['host']}...")
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() < deadline:
         try:
-            if requests.get(url, timeout=2).status_code == 200:
+            if SESSION.head(url, timeout=2).status_code == 200:
                 print("✅ Elasticsearch is ready!")
                 return True
-        except requests.ConnectionError:
+        except requests.RequestException:
             pass
-        time.sleep(1)
+        time.sleep(delay)
+        delay = min(delay * 1.5, max_delay)
         print(".", end="", flush=True)
     print("\n❌ Error: Elasticsearch unreachable.")
     return False
 
 
-def run_docker_task(task_name, script_path):
-    """Runs a script INSIDE the offline container via Docker Compose."""
+def run_docker_task(task_name, module):
+    """
+    Runs a step's main() INSIDE the long-lived offline container.
+    `exec` reuses the running container instead of creating one per step.
+    """
     print(f"\n>>> Starting: {task_name}")
-    start_time = time.time()
+    start_time = time.perf_counter()
 
     cmd = [
-        "docker", "compose", "run", "--rm",
+        "docker", "compose", "exec", "-T",
         "offline",
-        "python", script_path
+        "python", "-c", f"from scripts.{module} import main; main()"
     ]
 
     try:
@@ -99,7 +121,24 @@ def run_docker_task(task_name, script_path):
         print(f"!!! Error in {task_name}")
         success = False
 
-    duration = time.time() - start_time
+    duration = time.perf_counter() - start_time
+    print(f"<<< Finished {task_name} in {duration:.2f} seconds.")
+    return success, duration
+
+
+def run_py(task_name, fn):
+    """Runs a step's main() in this interpreter (no process/container startup)."""
+    print(f"\n>>> Starting (in-process): {task_name}")
+    start_time = time.perf_counter()
+
+    try:
+        fn()
+        success = True
+    except Exception as e:
+        print(f"!!! Error in {task_name}: {e}")
+        success = False
+
+    duration = time.perf_counter() - start_time
     print(f"<<< Finished {task_name} in {duration:.2f} seconds.")
     return success, duration
 
@@ -115,6 +154,11 @@ def run_local_command(name, cmd):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Full initialization benchmark")
+    parser.add_argument("--local", action="store_true",
+                        help="run the steps in-process on the host instead of in the offline container")
+    args = parser.parse_args()
+
     print("🤖 STARTING FULL INITIALIZATION BENCHMARK (TRUE FRESH START) 🤖")
 
     # 0. HARD RESET
@@ -132,18 +176,31 @@ def main():
     if not wait_for_elasticsearch():
         sys.exit(1)
 
-    # 2. DOWNLOAD (I/O Bound - Network)
-    ok, t_dl = run_docker_task("Download Books", "scripts/download_books.py")
-    if ok: results.append(("Download", t_dl))
+    if args.local:
+        # Étapes importées et exécutées dans ce même interpréteur
+        from scripts import download_books, index_to_elasticsearch, build_graphs
+        steps = [
+            ("Download", "Download Books", download_books.main),
+            ("Indexing", "Indexing to ES", index_to_elasticsearch.main),
+            ("Graph Build", "Graph Calculation", build_graphs.main),
+        ]
+        run_step = run_py
+    else:
+        # Un seul conteneur offline pour toutes les étapes
+        run_local_command("Start Worker", ["docker", "compose", "up", "-d", "offline"])
+        steps = [
+            ("Download", "Download Books", "download_books"),
+            ("Indexing", "Indexing to ES", "index_to_elasticsearch"),
+            ("Graph Build", "Graph Calculation", "build_graphs"),
+        ]
+        run_step = run_docker_task
 
+    # 2. DOWNLOAD (I/O Bound - Network)
     # 3. INDEXING (I/O Bound - Disk/Network)
-    # Cette fois, l'index n'existe plus, donc l'indexation se fera vraiment !
-    ok, t_idx = run_docker_task("Indexing to ES", "scripts/index_to_elasticsearch.py")
-    if ok: results.append(("Indexing", t_idx))
-
     # 4. GRAPH BUILDING (CPU/RAM Bound)
-    ok, t_graph = run_docker_task("Graph Calculation", "scripts/build_graphs.py")
-    if ok: results.append(("Graph Build", t_graph))
+    for label, task_name, target in steps:
+        ok, duration = run_step(task_name, target)
+        if ok: results.append((label, duration))
 
     # 5. REPORT
     final_size = get_dir_size(config.PATHS["data"])
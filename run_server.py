@@ -3,18 +3,24 @@ import time
 import sys
 import requests
 
-def wait_for_server():
-    """Waits for the server to be ready."""
+# Keep-alive session for the readiness probes
+SESSION = requests.Session()
+
+def wait_for_server(timeout=30, max_delay=2.0):
+    """Waits for the server to be ready (exponential backoff on /healthz)."""
     print("Awaiting server...")
-    url = "http://localhost:8000/api/search?q=test"
-    for _ in range(30):
+    url = "http://localhost:8000/healthz"
+    delay = 0.1
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
         try:
-            if requests.get(url).status_code in [200, 400]:
+            if SESSION.head(url, timeout=1).status_code == 200:
                 print("Server ready!")
                 return
-        except:
+        except requests.RequestException:
             pass
-        time.sleep(1)
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
         print(".", end="", flush=True)
 
 def main():
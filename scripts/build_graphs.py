@@ -1,183 +1,576 @@
 import os
 import re
+import math
+import mmap
+import gc
 import time
+import argparse
+import cProfile
+import pstats
+from contextlib import contextmanager
 import pandas as pd
-import networkx as nx
 import nltk
 from nltk.corpus import stopwords
-from multiprocessing import Pool
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from numba import njit, prange
+from sklearn.feature_extraction.text import HashingVectorizer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 try:
     import config
 except ImportError:
     from scripts import config
 
+# Punctuation stripping: anything that is neither a word char nor a space.
+# On pure-ASCII text the same deletion is done by str.translate (C byte map)
+PUNCT_RE = re.compile(r'[^\w\s]')
+ASCII_PUNCT_TABLE = {c: None for c in range(128) if PUNCT_RE.match(chr(c))}
+
+# Functions listed per stage by --profile
+PROFILE_TOP = 15
+
+# Dijkstra sources per batch (bounds the batch x N distance matrix)
+CLOSENESS_BATCH = 256
+
 # --- Global variables for Multiprocessing workers ---
-SHARED_BOOKS = {}
-SHARED_IDS = []
-SHARED_GRAPH = None
-STOP_WORDS = set()
+STOP_WORDS = frozenset()
+VECTORIZER = None
+# Worker processes shared by every parallel phase (see get_executor)
+EXECUTOR = None
 
-def init_worker_loader():
-    """Initializes the worker's shared variables."""
-    global STOP_WORDS
+def load_stop_words():
+    """English + French stop words, downloaded once by the parent process if missing."""
     try:
         nltk.data.find('corpora/stopwords')
     except LookupError:
         nltk.download('stopwords', quiet=True)
 
-    en_stops = set(stopwords.words('english'))
-    fr_stops = set(stopwords.words('french'))
-    STOP_WORDS = en_stops.union(fr_stops)
+    return frozenset(stopwords.words('english')) | frozenset(stopwords.words('french'))
+
+def init_worker_loader(stop_words):
+    """Initializes the worker's shared variables."""
+    global STOP_WORDS, VECTORIZER
+    STOP_WORDS = stop_words
+
+    # Words are hashed straight to term ids: no vocabulary, no str kept
+    VECTORIZER = HashingVectorizer(analyzer=analyze_text, binary=True,
+                                   alternate_sign=False, norm=None,
+                                   n_features=config.SIMILARITY["hash_features"])
+
+def get_executor():
+    """
+    Starts the worker processes once (initialized by init_worker_loader)
+    and reuses them for loading, MinHash signatures and closeness.
+    """
+    global EXECUTOR
+    if EXECUTOR is None:
+        EXECUTOR = ProcessPoolExecutor(max_workers=config.WORKERS.cpu_intensive,
+                                       initializer=init_worker_loader,
+                                       initargs=(load_stop_words(),))
+    return EXECUTOR
+
+def adaptive_chunksize(n_tasks):
+    """About 4 chunks per worker (N / 4W), capped so one slow chunk cannot stall a phase."""
+    return max(1, min(50, n_tasks // (config.WORKERS.cpu_intensive * 4)))
+
+def shutdown_executor():
+    global EXECUTOR
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown()
+        EXECUTOR = None
+
+def analyze_text(text):
+    """Cleaned words of a book (punctuation stripped, stop words/short words dropped)."""
+    text = text.lower()
+    if text.isascii():  # O(1) check, most Gutenberg files
+        text = text.translate(ASCII_PUNCT_TABLE)
+    else:
+        text = PUNCT_RE.sub('', text)
+    return [word for word in text.split()
+            if word not in STOP_WORDS and len(word) > 2]
 
 def process_single_book_file(filename):
-    """Worker function to load and clean one book file."""
-    book_id = filename.replace(".txt", "")
+    """
+    Worker function to load one book file as sorted unique term ids.
+    Returns (book_id, None) for an empty or unreadable file.
+    """
+    book_id = int(filename[:-len(".txt")])
     path = os.path.join(config.PATHS["books"], filename)
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            text= f.read()
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return book_id, None
+            # Decoded straight from the page cache: no intermediate bytes copy
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mem:
+                text = str(mem, "utf-8", "ignore")
+
+        row = VECTORIZER.transform([text])
+        row.sort_indices()
+        return book_id, row.indices.astype(np.int32)
+    except IOError:
+        return book_id, None
 
-        if not text:
-            return None
 
-        text = re.sub(r'[^\w\s]', '', text.lower())
-        unique_words = {
-            word for word in text.split()
-            if word not in STOP_WORDS and len(word) > 2
-        }
+def load_term_cache(path):
+    """
+    {book_id: (mtime_ns, term ids)} saved by a previous run, {} if missing
+    or built with another hashed term space. Term ids are None for the
+    tombstones of empty/unreadable files.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        table = pq.read_table(path)
+    except (OSError, pa.ArrowException):
+        return {}
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"hash_features") != str(config.SIMILARITY["hash_features"]).encode():
+        return {}
 
-        return book_id, unique_words
-    except IOError:
-        return None
+    terms = table.column("terms").combine_chunks()
+    flat = terms.values.to_numpy()
+    offsets = terms.offsets.to_numpy()
+    tombstones = terms.is_null().to_numpy(zero_copy_only=False)
+    ids = table.column("id").to_numpy()
+    mtimes = table.column("mtime_ns").to_numpy()
+    return {int(book_id): (int(mtimes[k]),
+                           None if tombstones[k] else flat[offsets[k]:offsets[k + 1]])
+            for k, book_id in enumerate(ids)}
+
+
+def save_term_cache(path, entries, mtimes):
+    """
+    Writes every book's term ids as one Parquet list column (atomic rename).
+    entries: {book_id: term ids}, None for a tombstone (stored as a null list).
+    """
+    book_ids = list(entries.keys())
+    terms = [entries[b] for b in book_ids]
+    empty = np.empty(0, dtype=np.int32)
+    offsets = np.zeros(len(book_ids) + 1, dtype=np.int32)
+    np.cumsum([0 if t is None else len(t) for t in terms], out=offsets[1:])
+    flat = (np.concatenate([empty if t is None else t for t in terms]) if book_ids
+            else empty)
+    tombstones = pa.array([t is None for t in terms], type=pa.bool_())
+
+    table = pa.table({
+        "id": pa.array(book_ids, type=pa.int32()),
+        "mtime_ns": pa.array([mtimes[b] for b in book_ids], type=pa.int64()),
+        "terms": pa.ListArray.from_arrays(pa.array(offsets), pa.array(flat),
+                                          mask=tombstones),
+    }).replace_schema_metadata({"hash_features": str(config.SIMILARITY["hash_features"])})
+
+    tmp_path = f"{path}.tmp"
+    try:
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARNING] Could not write term cache: {e}")
 
 
 def load_books_parallel():
-    """Loads all book files in parallel."""
+    """
+    Loads all book files in parallel. Books unchanged since the last run
+    (same mtime) are taken from the term cache instead of re-tokenized,
+    empty/unreadable ones are skipped through their cached tombstone.
+    """
     books_dir = config.PATHS["books"]
     if not os.path.exists(books_dir):
         print(f"[ERROR] No books found in {books_dir}")
         return {}
-    file_list = [f for f in os.listdir(books_dir) if f.endswith(".txt")]
+    mtimes, sizes = {}, {}
+    with os.scandir(books_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".txt") and entry.name[:-len(".txt")].isdigit():
+                book_id = int(entry.name[:-len(".txt")])
+                stat = entry.stat()
+                mtimes[book_id], sizes[book_id] = stat.st_mtime_ns, stat.st_size
+
+    cache = load_term_cache(config.PATHS["terms_cache"])
+    entries = {}  # Term ids per book, None for a tombstone
+    file_list = []
+    for book_id, mtime in mtimes.items():
+        cached = cache.get(book_id)
+        if cached is not None and cached[0] == mtime:
+            entries[book_id] = cached[1]
+        else:
+            file_list.append(f"{book_id}.txt")
+
+    # Largest books first: no big book left alone on one worker at the end
+    file_list.sort(key=lambda name: sizes[int(name[:-len(".txt")])], reverse=True)
 
     workers = config.WORKERS.cpu_intensive
-    print(f"Loading and cleaning {len(file_list)} books on {workers} cores...")
+    print(f"Loading and cleaning {len(file_list)} books on {workers} cores "
+          f"({len(entries)} from cache)...")
 
     start = time.time()
-    with Pool(processes=workers, initializer=init_worker_loader) as pool:
-        results = pool.map(process_single_book_file, file_list, chunksize=20)
+    if file_list:
+        results = get_executor().map(process_single_book_file, file_list,
+                                     chunksize=adaptive_chunksize(len(file_list)))
+        entries.update(results)
 
-    books = {r[0]: r[1] for r in results if r is not None}
+    # Directory order, whether a book came from the cache or not
+    entries = {book_id: entries[book_id] for book_id in mtimes}
+    if file_list or len(entries) != len(cache):
+        save_term_cache(config.PATHS["terms_cache"], entries, mtimes)
+    books = {book_id: terms for book_id, terms in entries.items() if terms is not None}
 
     print(f"Loading finished in {time.time() - start:.2f}s.")
     return books
 
-def compute_jaccard(set_a, set_b):
-    """Computes Jaccard similarity."""
-    intersection = len(set_a.intersection(set_b))
-    union = len(set_a.union(set_b))
-    return intersection / union if union > 0 else 0.0
-
-# --- WORKER FUNCTIONS (GRAPH) ---
-
-
-def worker_init_books(books_dict, books_ids):
-    global SHARED_BOOKS, SHARED_IDS
-    SHARED_BOOKS = books_dict
-    SHARED_IDS = books_ids
-
-def worker_init_graph(graph):
-    global SHARED_GRAPH
-    SHARED_GRAPH = graph
-
-
-def worker_compare_row(i):
-    local_edges = []
-    id_a = SHARED_IDS[i]
-    set_a = SHARED_BOOKS[id_a]
-    n = len(SHARED_IDS)
-
-    threshold = config.CONSTRAINTS["jaccard_threshold"]
-    for j in range(i + 1, n):
-        id_b = SHARED_IDS[j]
-        set_b = SHARED_BOOKS[id_b]
-
-        score = compute_jaccard(set_a, set_b)
-        if score > threshold:
-            local_edges.append((id_a, id_b, score))
-    return local_edges
-
-def worker_closeness(nodes_subset):
-    res = {}
-    for node in nodes_subset:
-        res[node] = nx.closeness_centrality(SHARED_GRAPH, u=node, distance='weight')
-    return res
-
 # --- ORCHESTRATION ---
 
-def build_edges_parallel(books):
+def build_book_term_matrix(books):
+    """
+    Stacks the term id arrays as a sparse book x term incidence matrix.
+    Returns (book_ids, M) with M[i, t] = 1 if term t is in book_ids[i].
+    """
     book_ids = list(books.keys())
-    n = len(book_ids)
-    cores = config.WORKERS.ram_intensive
-
-    print(f"Computing similarities for {n} books on {cores} CPU cores ...")
+    terms = [books[book_id] for book_id in book_ids]
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in terms], out=indptr[1:])
+    indices = np.concatenate(terms) if terms else np.empty(0, dtype=np.int32)
+
+    data = np.ones(len(indices), dtype=np.int32)
+    matrix = csr_matrix((data, indices, indptr),
+                        shape=(len(book_ids), config.SIMILARITY["hash_features"]))
+    # Sorted term ids per row (required by count_intersections)
+    matrix.sort_indices()
+    return book_ids, matrix
+
+
+@njit(parallel=True, cache=True)
+def count_intersections(indptr, indices, rows, cols):
+    """|A & B| for each (rows[k], cols[k]) pair: merge scan of two sorted CSR rows."""
+    out = np.empty(len(rows), dtype=np.int64)
+    for k in prange(len(rows)):
+        a, a_end = indptr[rows[k]], indptr[rows[k] + 1]
+        b, b_end = indptr[cols[k]], indptr[cols[k] + 1]
+        count = 0
+        while a < a_end and b < b_end:
+            term_a, term_b = indices[a], indices[b]
+            if term_a == term_b:
+                count += 1
+                a += 1
+                b += 1
+            elif term_a < term_b:
+                a += 1
+            else:
+                b += 1
+        out[k] = count
+    return out
+
+
+def worker_minhash(terms):
+    """MinHash signature of one book's term ids."""
+    from datasketch import MinHash
+
+    mh = MinHash(num_perm=config.SIMILARITY["num_perm"])
+    mh.update_batch([term.to_bytes(4, 'little') for term in terms.tolist()])
+    return mh
+
+
+def lsh_candidate_pairs(books, book_ids):
+    """
+    Pairs (i, j), i < j, whose MinHash signatures collide in an LSH band.
+    Only these pairs get an exact Jaccard score.
+    """
+    from datasketch import MinHashLSH
+
+    minhashes = list(get_executor().map(worker_minhash, [books[b] for b in book_ids],
+                                        chunksize=adaptive_chunksize(len(book_ids))))
+
+    lsh = MinHashLSH(threshold=config.SIMILARITY["lsh_threshold"],
+                     num_perm=config.SIMILARITY["num_perm"])
+    for i, mh in enumerate(minhashes):
+        lsh.insert(i, mh)
+
+    pairs = {(i, j) for i, mh in enumerate(minhashes) for j in lsh.query(mh) if i < j}
+    pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def jaccard_scores(sizes, rows, cols, inter_sizes):
+    """|A & B| / |A | B| for each (rows[k], cols[k]) pair."""
+    union = sizes[rows] + sizes[cols] - inter_sizes
+    return inter_sizes / np.maximum(union, 1)
+
+
+def exact_pairs(matrix, sizes, threshold):
+    """
+    Thresholded Jaccard scores of all pairs (i < j), one block of rows at a time:
+    each block is only multiplied by the rows from the block start onwards
+    (upper-triangular tiles), so the full N x N product is never materialized.
+    """
+    n = matrix.shape[0]
+    block = config.SIMILARITY["block_rows"]
+    # Renumber the used term ids densely: every block product transposes
+    # its right operand, which is O(term space) on the 2**24 hashed ids
+    used, dense = np.unique(matrix.indices, return_inverse=True)
+    matrix = csr_matrix((matrix.data, dense.astype(np.int32), matrix.indptr),
+                        shape=(n, len(used)))
+    columns = matrix.T  # CSC view, cheap column slices
+    rows_out, cols_out, scores_out = [], [], []
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        tile = (matrix[start:stop] @ columns[:, start:]).tocoo()
+        rows = tile.row + start
+        cols = tile.col + start
+        upper = cols > rows
+        rows, cols, inter_sizes = rows[upper], cols[upper], tile.data[upper]
+
+        scores = jaccard_scores(sizes, rows, cols, inter_sizes)
+        keep = scores > threshold
+        rows_out.append(rows[keep])
+        cols_out.append(cols[keep])
+        scores_out.append(scores[keep])
+
+    if not rows_out:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    return np.concatenate(rows_out), np.concatenate(cols_out), np.concatenate(scores_out)
+
+
+def build_edges(books):
+    """
+    Jaccard similarity of book pairs from a sparse incidence matrix M:
+    |A & B| = (M @ M.T)[a, b] and |A | B| = |A| + |B| - |A & B|.
+    "exact" scores every pair, "minhash" only the LSH candidates.
+    """
+    n = len(books)
+    method = config.SIMILARITY["method"]
+    print(f"Computing similarities for {n} books (method: {method}) ...")
     start = time.time()
 
-    with Pool(processes=cores, initializer=worker_init_books, initargs=(books, book_ids)) as pool:
-        results = pool.map(worker_compare_row, range(n), chunksize=10)
+    book_ids, matrix = build_book_term_matrix(books)
+    sizes = np.diff(matrix.indptr)
 
-    edges = [edge for sublist in results for edge in sublist]
+    threshold = config.CONSTRAINTS["jaccard_threshold"]
+    if method == "minhash":
+        rows, cols = lsh_candidate_pairs(books, book_ids)
+        print(f"LSH kept {len(rows)} candidate pairs out of {n * (n - 1) // 2}.")
+        inter_sizes = count_intersections(matrix.indptr, matrix.indices, rows, cols)
+        scores = jaccard_scores(sizes, rows, cols, inter_sizes)
+        keep = scores > threshold
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+    else:
+        rows, cols, scores = exact_pairs(matrix, sizes, threshold)
+    # Same edge order as a row-by-row scan (i, then j > i)
+    order = np.lexsort((cols, rows))
+
+    # Columnar edge list (no per-edge Python tuple)
+    ids = np.asarray(book_ids, dtype=np.int32)
+    edges = pd.DataFrame({
+        "source": ids[rows[order]],
+        "target": ids[cols[order]],
+        "weight": scores[order].astype(np.float32),
+    })
 
     elapsed = time.time() - start
     print(f"Jaccard computation finished in {elapsed:.2f}s. Found {len(edges)} edges.")
     return edges
 
 
-def compute_centrality_parallel(edges):
-    graph = nx.Graph()
-    for u, v, w in edges:
-        dist = 1.0 - w if w < 1.0 else 0.001
-        graph.add_edge(u, v, weight=dist)
+def worker_closeness(dist_graph, sources):
+    """Closeness of a batch of source nodes (one C Dijkstra per source)."""
+    n = dist_graph.shape[0]
+    # Both directions are stored: directed=True skips csgraph's transpose copy
+    lengths = dijkstra(dist_graph, directed=True, indices=sources)
+    reachable = np.isfinite(lengths)
+    totsp = np.where(reachable, lengths, 0.0).sum(axis=1)
+    n_reach = reachable.sum(axis=1) - 1  # Excluding the source itself
+    with np.errstate(divide='ignore', invalid='ignore'):
+        closeness = np.where(totsp > 0, n_reach / totsp, 0.0)
+    # Wasserman-Faust scaling for disconnected graphs
+    if n > 1:
+        closeness *= n_reach / (n - 1)
+    return closeness
+
+
+def worker_sampled_distances(dist_graph, sources):
+    """Per-node sum of distances to a batch of sampled sources, and how many reach it."""
+    lengths = dijkstra(dist_graph, directed=True, indices=sources)
+    reachable = np.isfinite(lengths)
+    return np.where(reachable, lengths, 0.0).sum(axis=0), reachable.sum(axis=0)
+
+
+@contextmanager
+def shared_csr(graph):
+    """
+    Publishes the arrays of a CSR matrix in SharedMemory blocks for the
+    lifetime of the context. Yields a small picklable spec (see attach_csr).
+    """
+    blocks, specs = [], []
+    try:
+        for array in (graph.indptr, graph.indices, graph.data):
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            specs.append((block.name, array.shape, array.dtype.str))
+        yield graph.shape, specs
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def worker_shared_graph(func, graph_spec, sources):
+    """Attaches the shared CSR matrix (no copy) and returns func(graph, sources)."""
+    shape, specs = graph_spec
+    blocks = [SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        indptr, indices, data = [np.ndarray(array_shape, dtype=dtype, buffer=block.buf)
+                                 for block, (_, array_shape, dtype) in zip(blocks, specs)]
+        graph = csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        result = func(graph, sources)
+        # Views must be gone before the blocks can be closed
+        del graph, indptr, indices, data
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def map_source_batches(func, dist_graph, sources):
+    """
+    Runs func(dist_graph, batch) over batches of at most CLOSENESS_BATCH
+    sources, at least one batch per worker. A Dijkstra costs about the edge
+    count of the source's component, so sources are dealt round-robin by
+    decreasing cost: every batch gets a similar share of the work.
+    Returns (batches, results).
+    """
+    n_batches = max(math.ceil(len(sources) / CLOSENESS_BATCH),
+                    min(len(sources), config.WORKERS.cpu_intensive))
+    _, labels = connected_components(dist_graph, directed=False)
+    component_edges = np.bincount(labels, weights=np.diff(dist_graph.indptr))
+    ordered = sources[np.argsort(-component_edges[labels[sources]], kind='stable')]
+    batches = [np.sort(ordered[k::n_batches]) for k in range(n_batches)]
+
+    if len(batches) <= 1:
+        return batches, [func(dist_graph, batch) for batch in batches]
+    # Workers attach one shared copy of the graph instead of unpickling their own
+    with shared_csr(dist_graph) as graph_spec:
+        n_tasks = len(batches)
+        return batches, list(get_executor().map(worker_shared_graph, [func] * n_tasks,
+                                                [graph_spec] * n_tasks, batches))
+
+
+def approximate_closeness(dist_graph, n_samples):
+    """
+    Eppstein-Wang estimate: Dijkstra from n_samples random sources only,
+    each node's distance total and reachable count extrapolated by n / n_samples
+    (then the same Wasserman-Faust formula as the exact closeness).
+    """
+    n = dist_graph.shape[0]
+    rng = np.random.default_rng(config.CONSTRAINTS["closeness_seed"])
+    sources = np.sort(rng.choice(n, size=n_samples, replace=False))
+
+    totsp = np.zeros(n)
+    hits = np.zeros(n)
+    _, results = map_source_batches(worker_sampled_distances, dist_graph, sources)
+    for batch_totsp, batch_hits in results:
+        totsp += batch_totsp
+        hits += batch_hits
+
+    scale = n / n_samples
+    totsp *= scale
+    n_reach = hits * scale - 1  # Excluding the node itself
+    with np.errstate(divide='ignore', invalid='ignore'):
+        closeness = np.where(totsp > 0, n_reach / totsp, 0.0)
+    if n > 1:
+        closeness *= n_reach / (n - 1)
+    return np.maximum(closeness, 0.0)
+
+
+def compute_pagerank(similarity, alpha=0.85, max_iter=100, tol=1.0e-6):
+    """
+    PageRank by power iteration on the symmetric similarity matrix, same
+    iteration and stopping rule as networkx pagerank(weight='weight').
+    """
+    n = similarity.shape[0]
+    out_weight = np.asarray(similarity.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    with np.errstate(divide='ignore'):
+        inv_weight = np.where(dangling, 0.0, 1.0 / out_weight)
+    # Row-stochastic transitions (x @ P is the next distribution)
+    transitions = csr_matrix(similarity.multiply(inv_weight[:, None]))
+
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        last = x
+        x = alpha * (x @ transitions + last[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - last).sum() < n * tol:
+            return x
+    raise RuntimeError(f"PageRank did not converge in {max_iter} iterations.")
+
+
+def compute_closeness(similarity):
+    """
+    Closeness of the nodes of a symmetric similarity matrix, same definition
+    as networkx closeness_centrality(distance=..., wf_improved=True): batches
+    of sources run on the worker processes (csgraph Dijkstra holds the GIL).
+    With CONSTRAINTS["closeness_epsilon"] set, only ceil(ln n / eps^2)
+    sampled sources are used (approximate_closeness).
+    """
+    n = similarity.shape[0]
+    # Similarity -> distance (1 - w, never 0: 0 means 'no edge' in csgraph),
+    # same sparsity structure as the similarity matrix
+    dist_graph = similarity.copy()
+    dist_graph.data = np.where(dist_graph.data < 1.0, 1.0 - dist_graph.data, 0.001)
+
+    epsilon = config.CONSTRAINTS["closeness_epsilon"]
+    if epsilon and n > 1:
+        n_samples = math.ceil(math.log(n) / epsilon ** 2)
+        if n_samples < n:
+            print(f"Approximating closeness from {n_samples} sampled sources.")
+            return approximate_closeness(dist_graph, n_samples)
+
+    closeness = np.zeros(n)
+    for batch, batch_closeness in zip(*map_source_batches(worker_closeness,
+                                                          dist_graph, np.arange(n))):
+        closeness[batch] = batch_closeness
+    return closeness
 
-    print(f"Graph built: {graph.number_of_nodes()} nodes.")
 
-    # PageRank (Sequential is fast enough)
-    pr_graph = nx.Graph()
-    pr_graph.add_weighted_edges_from(edges)
+def compute_centrality_parallel(edges):
+    # Nodes in first-seen order (as networkx would list them), edges as
+    # (row, col) codes into that node list
+    endpoints = np.column_stack((edges["source"].to_numpy(),
+                                 edges["target"].to_numpy())).ravel()
+    codes, nodes = pd.factorize(endpoints)
+    rows, cols = codes[0::2], codes[1::2]
+    weights = edges["weight"].to_numpy(dtype=np.float64)
+
+    # One symmetric similarity matrix shared by both metrics
+    n = len(nodes)
+    similarity = csr_matrix((weights, (rows, cols)), shape=(n, n))
+    similarity = (similarity + similarity.T).tocsr()
+    print(f"Graph built: {n} nodes.")
+
+    # PageRank (sparse power iteration)
     print("Calculating PageRank...")
-    pagerank = nx.pagerank(pr_graph, weight='weight')
-
-    # Closeness (Parallel - Max Cores)
-    cores = config.WORKERS.cpu_intensive
-
-    print(f"Calculating Closeness on {cores} cores...")
-    nodes_list = list(graph.nodes())
+    pagerank = compute_pagerank(similarity)
 
-    if nodes_list:
-        num_chunks = min(len(nodes_list), cores)
-        chunks = np.array_split(nodes_list, num_chunks)
+    # Closeness (all-sources Dijkstra in C, batches on the workers)
+    print("Calculating Closeness...")
+    start_c = time.time()
+    closeness = compute_closeness(similarity)
+    print(f"Closeness calculation took {time.time() - start_c:.2f}s.")
 
-        start_c = time.time()
-        with Pool(processes=cores, initializer=worker_init_graph, initargs=(graph,)) as pool:
-            results = pool.map(worker_closeness, chunks)
-
-        closeness = {}
-        for res in results:
-            closeness.update(res)
-        print(f"Closeness calculation took {time.time() - start_c:.2f}s.")
-    else:
-        closeness = {}
-
-    return pd.DataFrame([
-        {
-            "id": node,
-            "pagerank": pagerank.get(node, 0),
-            "closeness": closeness.get(node, 0)
-        }
-        for node in nodes_list
-    ])
+    return pd.DataFrame({
+        "id": nodes,
+        "pagerank": pagerank,
+        "closeness": closeness,
+    })
 
 
 def save_data(df_ranks, edges):
@@ -185,32 +578,93 @@ def save_data(df_ranks, edges):
         print("[WARN] No ranking data to save.")
         return
 
-    rank_file = config.PATHS["ranks_csv"]
-    graph_file = config.PATHS["graph_csv"]
+    rank_file = config.PATHS["ranks_parquet"]
+    graph_file = config.PATHS["graph_parquet"]
     data_dir = config.PATHS["data"]
 
+    # Columnar + zstd: binary numeric columns, no float formatting
     df_ranks.sort_values("pagerank", ascending=False, inplace=True)
-    df_ranks.to_csv(rank_file, index=False)
+    df_ranks.to_parquet(rank_file, engine="pyarrow", compression="zstd", index=False)
+
+    edges.to_parquet(graph_file, engine="pyarrow", compression="zstd", index=False)
 
-    df_edges = pd.DataFrame(edges, columns=["source", "target", "weight"])
-    df_edges.to_csv(graph_file, index=False)
+    # Stale CSVs from older runs would otherwise be shadowed silently
+    for legacy in (config.PATHS["ranks_csv"], config.PATHS["graph_csv"]):
+        if os.path.exists(legacy):
+            os.remove(legacy)
     print(f"Saved data to {data_dir}")
 
-if __name__ == "__main__":
-    print("Starting Graph Build Script...")
 
-    # 1. Parallel Load
-    book_data = load_books_parallel()
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def profile_stage(name, enabled):
+    """
+    With --profile: wall time, peak RSS and cProfile hot spots of one stage.
+    Only the main process is profiled: time spent in the worker processes
+    shows up as waits on the executor.
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        rss = peak_rss_mb()
+        rss_text = f", peak RSS {rss:.0f} MB" if rss is not None else ""
+        print(f"\n[PROFILE] {name}: {time.perf_counter() - start:.2f}s{rss_text}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+def main(profile=False):
+    """
+    Runs the full offline graph pipeline (load -> edges -> centrality).
+    profile: print per-stage timings, peak RSS and hot functions.
+    """
+    print("Starting Graph Build Script...")
 
-    if book_data:
-        # 2. Parallel Graph (Reduced cores for RAM)
-        graph_edges = build_edges_parallel(book_data)
+    try:
+        # 1. Parallel Load
+        with profile_stage("load", profile):
+            book_data = load_books_parallel()
+
+        if book_data:
+            # 2. Similarity Graph (single sparse matrix product)
+            with profile_stage("edges", profile):
+                graph_edges = build_edges(book_data)
+
+            # The term arrays are not needed anymore: free them before the
+            # centrality step
+            del book_data
+            gc.collect()
+
+            if len(graph_edges):
+                # 3. Metrics (PageRank + parallel C Dijkstra closeness)
+                with profile_stage("centrality", profile):
+                    ranks_df = compute_centrality_parallel(graph_edges)
+                with profile_stage("save", profile):
+                    save_data(ranks_df, graph_edges)
+            else:
+                print("No edges found.")
+    finally:
+        # Same workers for loading, MinHash and closeness
+        shutdown_executor()
+
+    print("Script finished successfully.")
 
-        if graph_edges:
-            # 3. Parallel Metrics (Max cores for CPU)
-            ranks_df = compute_centrality_parallel(graph_edges)
-            save_data(ranks_df, graph_edges)
-        else:
-            print("No edges found.")
 
-    print("Script finished successfully.")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the similarity graph and book ranks.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings, peak RSS and cProfile hot spots")
+    main(profile=parser.parse_args().profile)
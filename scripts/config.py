@@ -13,8 +13,16 @@ PATHS = {
     "data": os.path.join(PROJECT_ROOT, "data"),
     "books": os.path.join(PROJECT_ROOT, "data", "books"),
     "metadata": os.path.join(PROJECT_ROOT, "data", "metadata.json"),
-    "graph_csv": os.path.join(PROJECT_ROOT, "data", "book_graph.csv"),
-    "ranks_csv": os.path.join(PROJECT_ROOT, "data", "book_ranks.csv"),
+    # Append-only checkpoint of an unfinished download run (merged on resume)
+    "metadata_log": os.path.join(PROJECT_ROOT, "data", "metadata.jsonl"),
+    "graph_csv": os.path.join(PROJECT_ROOT, "data", "book_graph.csv"),  # Legacy
+    "ranks_csv": os.path.join(PROJECT_ROOT, "data", "book_ranks.csv"),  # Legacy
+    "graph_parquet": os.path.join(PROJECT_ROOT, "data", "book_graph.parquet"),
+    "ranks_parquet": os.path.join(PROJECT_ROOT, "data", "book_ranks.parquet"),
+    # Term ids of every book from the last build_graphs run (keyed by mtime)
+    "terms_cache": os.path.join(PROJECT_ROOT, "data", "book_terms.parquet"),
+    # IDs found in Elasticsearch by the last scan (valid while the index is unchanged)
+    "indexed_ids_cache": os.path.join(PROJECT_ROOT, "data", "indexed_ids.npz"),
 }
 GUTENDEX_API = "http://gutendex.com/books/"
 
@@ -23,14 +31,34 @@ ELASTIC = {
     "host": os.environ.get('ES_HOST', 'http://localhost:9200'),
     "index_name": 'gutenberg_books',
     "timeout": 30,
-    "bulk_chunk_size": 50
+    "bulk_chunk_size": 50,
+    "bulk_max_bytes": 50 * 1024 * 1024,  # Below ES http.max_content_length (100 MB)
+    "bulk_timeout": 60,   # Gzipped bulk bodies of several MB
+    "bulk_pipeline": 4,   # In-flight bulk requests per thread (bounds read-ahead RAM)
+    "bulk_max_retries": 3,  # Retries of items rejected with 429 (ES indexing pressure)
+    "bulk_backoff": 2,      # Wait 2s, 4s, 8s... before each retry
+    "pool_size": 32  # Keep-alive connections per client
 }
 
 # --- 4. PROJECT CONSTRAINTS ---
 CONSTRAINTS = {
     "target_books": 1670,
     "min_words_per_book": 10000,
-    "jaccard_threshold": 0.15
+    "jaccard_threshold": 0.15,
+    # Closeness from ~ln(n)/eps^2 sampled sources instead of all n (None = exact)
+    "closeness_epsilon": (float(os.environ['CLOSENESS_EPSILON'])
+                          if os.environ.get('CLOSENESS_EPSILON') else None),
+    "closeness_seed": 42
+}
+
+# Similarity graph: "exact" (all pairs, sparse product) or "minhash"
+# (MinHash LSH prefilter, exact Jaccard on candidate pairs only)
+SIMILARITY = {
+    "method": os.environ.get('SIMILARITY_METHOD', 'exact'),
+    "hash_features": 1 << 24,  # Hashed term space (collisions stay negligible)
+    "num_perm": 128,
+    "lsh_threshold": 0.10,  # Below jaccard_threshold to limit false negatives
+    "block_rows": 256  # Rows per SpGEMM block in the exact method
 }
 
 # --- 5. NETWORK & RETRY STRATEGY ---
@@ -73,13 +101,21 @@ class ResourceAllocator:
         """
         return 8 if IN_DOCKER else 4
 
+    @property
+    def mixed(self):
+        """
+        For tasks mixing disk reads, encoding and network (e.g., Elastic Indexing).
+        """
+        return max(2, (SYSTEM_CORES * 3) // 2)
+
     @property
     def download(self):
         """
-        Specific worker count for downloading books.
-        13 was found to be the 'Sweet Spot' in benchmarks (Fast & Safe).
+        Specific worker count for downloading books (pure network I/O).
+        Scales with the cores, capped at 13: the 'Sweet Spot' found in
+        benchmarks before Gutenberg starts rate limiting (Fast & Safe).
         """
-        return 13
+        return min(13, SYSTEM_CORES * 3 * 4)
 
 
 WORKERS = ResourceAllocator()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import time
-import json
+import queue
+import orjson
 import requests
 import concurrent.futures
 from requests.adapters import HTTPAdapter
@@ -11,9 +12,15 @@ try:
 except ImportError:
     from scripts import config
 
+# Streamed download chunks (word count runs per chunk, no full token list)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
-def get_robust_session():
-    """Creates a requests session with automatic retry logic from config."""
+
+def get_robust_session(pool_size=10):
+    """
+    Creates a requests session with automatic retry logic from config.
+    pool_size: keep-alive connections kept per host (one per thread sharing it).
+    """
     session = requests.Session()
     retry_strategy = Retry(
         total=config.NETWORK["retry_total"],
@@ -21,28 +28,51 @@ def get_robust_session():
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["HEAD", "GET", "OPTIONS"]
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(max_retries=retry_strategy,
+                          pool_connections=pool_size, pool_maxsize=pool_size)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
 
-def book_exists_on_disk(book_id):
-    """Checks if the book file already exists locally."""
-    filename = os.path.join(config.PATHS["books"], f"{book_id}.txt")
-    return os.path.exists(filename) and os.path.getsize(filename) > 0
-
-
-def save_book_to_disk(book_id, text_content):
-    """Writes the book content to a text file."""
+def save_book_to_disk(book_id, content):
+    """
+    Writes the UTF-8 encoded book content with raw os.write calls (no text layer).
+    Returns book_id on success, None otherwise (a partial file is removed).
+    """
     filename = os.path.join(config.PATHS["books"], f"{book_id}.txt")
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(text_content)
-        return True
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
     except IOError as e:
         print(f"[ERROR] Could not save book {book_id}: {e}")
-        return False
+        return None
+    try:
+        try:
+            view = memoryview(content)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        return book_id
+    except IOError as e:
+        print(f"[ERROR] Could not save book {book_id}: {e}")
+        # Not in disk_ids, so the orphan cleanup would never see it
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return None
+
+
+def scan_book_sizes(books_dir):
+    """{book_id: size in bytes} of the book files in books_dir (one scandir pass)."""
+    sizes = {}
+    with os.scandir(books_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.endswith(".txt") and name[:-4].isdigit():
+                sizes[int(name[:-4])] = entry.stat().st_size
+    return sizes
 
 
 def get_text_url(book_data):
@@ -53,14 +83,41 @@ def get_text_url(book_data):
             formats.get("text/plain"))
 
 
-def process_book_task(book_data):
+def download_text(session, url):
+    """
+    Streams a book body in DOWNLOAD_CHUNK_SIZE chunks, counting words on the fly.
+    Returns (raw bytes, word count), or (None, 0) on HTTP 429.
+    """
+    with session.get(url, timeout=config.NETWORK["timeout"], stream=True) as resp:
+        # Even with retries, we might get a 429 if we exhausted attempts
+        if resp.status_code == 429:
+            return None, 0
+
+        body = bytearray()
+        word_count = 0
+        in_word = False  # Previous chunk ended inside a word
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if not chunk:
+                continue
+            word_count += len(chunk.split())
+            # A word cut by the chunk boundary was counted twice
+            if in_word and not chunk[:1].isspace():
+                word_count -= 1
+            in_word = not chunk[-1:].isspace()
+            body += chunk
+    return body, word_count
+
+
+def process_book_task(book_data, session, disk_sizes):
     """
     Worker task: Checks existence, downloads if needed, validates constraint.
+    session: download session shared by all workers (connection reuse).
+    disk_sizes: sizes of the book files found on disk at startup.
     """
     book_id = book_data.get("id")
 
-    # 1. Fast path: Check existing
-    if book_exists_on_disk(book_id):
+    # 1. Fast path: Check existing (in-memory lookup, no syscall)
+    if disk_sizes.get(book_id, 0) > 0:
         authors = book_data.get("authors", [])
         return {
             "id": book_id,
@@ -76,26 +133,19 @@ def process_book_task(book_data):
     if not url:
         return None
 
-    # 3. Download with robust session
-    session = get_robust_session()
-
+    # 3. Download with the shared robust session
     try:
-        resp = session.get(url, timeout=config.NETWORK["timeout"])
-
-        # Even with retries, we might get a 429 if we exhausted attempts
-        if resp.status_code == 429:
+        body, word_count = download_text(session, url)
+        if body is None:
             return None
 
-        resp.encoding = 'utf-8'
-        text = resp.text
-
-        # 4. Constraint Check
-        word_count = len(text.split())
+        # 4. Constraint Check (rejected books are never decoded)
         if word_count < config.CONSTRAINTS["min_words_per_book"]:
             return None
 
-        # 5. Save
-        if save_book_to_disk(book_id, text):
+        # 5. Save (invalid UTF-8 bytes replaced, like resp.text would)
+        content = body.decode('utf-8', errors='replace').encode('utf-8')
+        if save_book_to_disk(book_id, content) is not None:
             authors = book_data.get("authors", [])
             return {
                 "id": book_id,
@@ -112,32 +162,47 @@ def process_book_task(book_data):
 
     return None
 
-def clean_orphans(valid_metadata):
+def task_result(future):
+    """Metadata returned by a finished download task, None if it failed or raised."""
+    if future.exception() is not None:
+        print(f"[ERROR] Download task: {future.exception()}")
+        return None
+    return future.result()
+
+def load_checkpoint(log_file):
+    """
+    Metadata entries appended to the JSONL checkpoint by an interrupted run.
+    A torn last line (crash during a write) is ignored.
+    """
+    entries = []
+    if not os.path.exists(log_file):
+        return entries
+    with open(log_file, "rb") as f:
+        for line in f:
+            try:
+                entries.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                break
+    return entries
+
+def clean_orphans(valid_metadata, disk_ids):
     """
     Removes .txt files that are not present in the metadata.
     Ensures consistency between disk and index.
+    disk_ids: IDs of the book files on disk, kept up to date by fetch_books.
     """
     print("\nStarting final cleanup of orphan files...")
 
-    # Create a set of valid IDs for O(1) lookup
-    valid_ids = {str(book['id']) for book in valid_metadata}
-
-    files = os.listdir(config.PATHS["books"])
+    orphans = disk_ids - {book['id'] for book in valid_metadata}
     deleted_count = 0
 
-    for filename in files:
-        if not filename.endswith(".txt"):
-            continue
-
-        book_id = filename.replace(".txt", "")
-
-        if book_id not in valid_ids:
-            file_path = os.path.join(config.PATHS["books"], filename)
-            try:
-                os.remove(file_path)
-                deleted_count += 1
-            except OSError:
-                pass
+    for book_id in orphans:
+        file_path = os.path.join(config.PATHS["books"], f"{book_id}.txt")
+        try:
+            os.remove(file_path)
+            deleted_count += 1
+        except OSError:
+            pass
 
     if deleted_count > 0:
         print(f"Cleanup finished. Deleted {deleted_count} orphan files.")
@@ -148,52 +213,89 @@ def fetch_books():
     """Main execution loop using Optimized Turbo Logic."""
     books_dir = config.PATHS["books"]
     metadata_file = config.PATHS["metadata"]
+    log_file = config.PATHS["metadata_log"]
     target_count = config.CONSTRAINTS["target_books"]
-    workers = config.WORKERS.download  # Using the tuned value (13)
+    workers = config.WORKERS.download  # Capped at the tuned value (13)
 
     if not os.path.exists(books_dir):
         os.makedirs(books_dir)
 
+    # Book files on disk: sizes for the existence fast path,
+    # IDs as the reference for the final orphan cleanup
+    disk_sizes = scan_book_sizes(books_dir)
+    disk_ids = set(disk_sizes)
+
     # Load existing metadata for resume
     books_metadata = []
     existing_ids = set()
     if os.path.exists(metadata_file):
         try:
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                books_metadata = json.load(f)
+            with open(metadata_file, "rb") as f:
+                books_metadata = orjson.loads(f.read())
                 existing_ids = {b['id'] for b in books_metadata}
-            print(f"Resuming... {len(books_metadata)} books already collected.")
         except:
             print("Metadata corrupted, starting fresh.")
+    # Books checkpointed after the last full save
+    for entry in load_checkpoint(log_file):
+        if entry['id'] not in existing_ids:
+            books_metadata.append(entry)
+            existing_ids.add(entry['id'])
+    if books_metadata:
+        print(f"Resuming... {len(books_metadata)} books already collected.")
 
     next_url = config.GUTENDEX_API
     session = get_robust_session()
+    # One pool for all download threads: keep-alive connections to the
+    # book server are reused instead of a new TCP/TLS handshake per book
+    download_session = get_robust_session(pool_size=workers)
 
     print(f"Target (Minimum): {target_count} books.")
     print(f"Download with {workers} workers:")
 
-    # Future tracking
-    all_futures = []
+    # Future tracking: finished tasks are pushed by their done callback,
+    # so harvesting only touches the tasks completed since the last pass
+    done_queue = queue.Queue()
+    pending_count = 0
     stop_queuing = False
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    # New entries are appended to the JSONL log (O(1) per book) instead of
+    # rewriting the whole metadata.json at every checkpoint
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+            open(log_file, "ab", buffering=1 << 20) as checkpoint:
 
         # PHASE 1: Aggressive Queueing (Fill the pipe)
         while not stop_queuing and next_url:
 
+            # --- Harvest Results Logic ---
+            while True:
+                try:
+                    future = done_queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending_count -= 1
+                res = task_result(future)
+                if res:
+                    books_metadata.append(res)
+                    existing_ids.add(res['id'])
+                    disk_ids.add(res['id'])
+                    checkpoint.write(orjson.dumps(res) + b"\n")
+
+                    if len(books_metadata) % 50 == 0:
+                        print(f"Progress: {len(books_metadata)} books.")
+                        checkpoint.flush()
+
+            # Check if we actually reached the target
+            if len(books_metadata) >= target_count:
+                stop_queuing = True
+                break
+
             # Stop fetching pages if we likely have enough tasks
-            # We estimate: current_meta + pending_futures >= target
-            pending_futures = [f for f in all_futures if not f.done()]
-            potential_total = len(books_metadata) + len(pending_futures)
+            # We estimate: current_meta + pending tasks >= target
+            potential_total = len(books_metadata) + pending_count
 
             if potential_total >= target_count + 50:  # Buffer of 50
                 # Wait for tasks to complete before queuing more
                 time.sleep(1)
-
-                # Check if we actually reached the target
-                if len(books_metadata) >= target_count:
-                    stop_queuing = True
-                    break
                 continue
 
             try:
@@ -204,39 +306,16 @@ def fetch_books():
                     time.sleep(10)
                     continue
 
-                data = resp.json()
+                data = orjson.loads(resp.content)
                 next_url = data.get("next")
                 results = data.get("results", [])
 
                 for book in results:
                     if book.get("id") not in existing_ids:
-                        future = executor.submit(process_book_task, book)
-                        all_futures.append(future)
-
-                # --- Harvest Results Logic ---
-                # We check completed tasks periodically to free memory
-                # and update the metadata list
-                done_indices = []
-                for i, future in enumerate(all_futures):
-                    if future.done():
-                        done_indices.append(i)
-                        res = future.result()
-                        if res:
-                            books_metadata.append(res)
-                            existing_ids.add(res['id'])
-
-                            if len(books_metadata) % 50 == 0:
-                                print(f"Progress: {len(books_metadata)} books.")
-                                with open(metadata_file, "w", encoding="utf-8") as f:
-                                    json.dump(books_metadata, f, indent=4)
-
-                # Remove harvested futures from the list (in reverse order)
-                for i in reversed(done_indices):
-                    all_futures.pop(i)
-
-                if len(books_metadata) >= target_count:
-                    stop_queuing = True
-                    break
+                        future = executor.submit(process_book_task, book,
+                                                 download_session, disk_sizes)
+                        pending_count += 1
+                        future.add_done_callback(done_queue.put)
 
                 # Small sleep between list pages to be polite
                 time.sleep(config.NETWORK["batch_sleep"])
@@ -247,22 +326,37 @@ def fetch_books():
 
         # PHASE 2: Drain the queue
         print("Finishing remaining downloads...")
-        for future in concurrent.futures.as_completed(all_futures):
-            if len(books_metadata) >= target_count:
-                break
-            res = future.result()
+        while pending_count > 0 and len(books_metadata) < target_count:
+            future = done_queue.get()
+            pending_count -= 1
+            res = task_result(future)
             if res:
                 books_metadata.append(res)
                 existing_ids.add(res['id'])
+                disk_ids.add(res['id'])
+                checkpoint.write(orjson.dumps(res) + b"\n")
 
-    # Final save
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        json.dump(books_metadata, f, indent=4)
+    # Tasks still running when the target was reached saved their files too
+    while not done_queue.empty():
+        res = task_result(done_queue.get_nowait())
+        if res:
+            disk_ids.add(res['id'])
+
+    # Final save (the checkpoint log is folded into metadata.json).
+    # Compact output: the file is only read back by the scripts
+    with open(metadata_file, "wb") as f:
+        f.write(orjson.dumps(books_metadata))
+    os.remove(log_file)
 
     print(f"Done. Total library size: {len(books_metadata)} books.")
 
-    clean_orphans(books_metadata)
+    clean_orphans(books_metadata, disk_ids)
+
+
+def main():
+    """Downloads the library and refreshes metadata.json."""
+    fetch_books()
 
 
 if __name__ == "__main__":
-    fetch_books()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,10 +1,15 @@
 import os
-import json
+import time
 import logging
+import argparse
+import orjson
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk, scan
-from elasticsearch_dsl import Document, Text, Integer, Keyword, connections
-from multiprocessing import Pool
+from elasticsearch.helpers import scan
+from elasticsearch_dsl import Document, Text, Integer, Keyword, MetaField, connections
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+from contextlib import contextmanager
 import numpy as np
 
 try:
@@ -16,15 +21,25 @@ except ImportError:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Read-ahead of book files while bulk requests are in flight
+PREFETCH_BOOKS = 16
+PREFETCH_THREADS = 4
+
 
 class BookDocument(Document):
     """Elasticsearch mapping definition."""
     gutenberg_id = Integer()
     title = Text(analyzer='standard')
-    author = Text(analyzer='standard')
+    # author.keyword: exact value for facets (terms aggregation)
+    author = Text(analyzer='standard', fields={'keyword': Keyword()})
     image_url = Keyword()
     content = Text(analyzer='standard')
 
+    class Meta:
+        # content is indexed (searchable) but not kept in _source: hits never
+        # carry the book text, which is served from disk by the API
+        source = MetaField(excludes=['content'])
+
     class Index:
         name = config.ELASTIC["index_name"]
         settings = {
@@ -44,13 +59,52 @@ def init_elasticsearch():
         logger.info(f"Index '{config.ELASTIC['index_name']}' already exists.")
 
 
-def get_indexed_ids(client):
-    """Retrieves all book IDs currently stored in the Elasticsearch index."""
+def index_fingerprint(client):
+    """
+    (index uuid, doc count, highest _seq_no) of the books index, None if missing.
+    Any index, delete or update bumps the _seq_no (1 shard), so the triple
+    changes whenever the set of indexed documents may have changed.
+    """
     index_name = config.ELASTIC["index_name"]
-
     if not client.indices.exists(index=index_name):
+        return None
+
+    settings = client.indices.get_settings(index=index_name)
+    uuid = next(iter(settings.values()))["settings"]["index"]["uuid"]
+    doc_count = client.count(index=index_name)["count"]
+    latest = client.search(index=index_name, size=1, sort=[{"_seq_no": "desc"}],
+                           seq_no_primary_term=True, source=False)["hits"]["hits"]
+    max_seq_no = latest[0]["_seq_no"] if latest else -1
+    return uuid, doc_count, max_seq_no
+
+
+def load_cached_ids(path, fingerprint):
+    """IDs saved by the last scan, or None if missing or stale (index changed)."""
+    try:
+        with np.load(path) as cache:
+            if tuple(cache["fingerprint"].tolist()) != tuple(map(str, fingerprint)):
+                return None
+            return set(cache["ids"].tolist())
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_indexed_ids(client, fingerprint):
+    """
+    Retrieves all book IDs currently stored in the Elasticsearch index.
+    The scan result is cached on disk and reused while the index fingerprint matches.
+    """
+    index_name = config.ELASTIC["index_name"]
+    cache_path = config.PATHS["indexed_ids_cache"]
+
+    if fingerprint is None:
         return set()
 
+    cached_ids = load_cached_ids(cache_path, fingerprint)
+    if cached_ids is not None:
+        logger.info("Using cached document IDs (index unchanged).")
+        return cached_ids
+
     logger.info("Scanning existing document IDs from Elasticsearch...")
     scanner = scan(
         client,
@@ -65,74 +119,176 @@ def get_indexed_ids(client):
         except (ValueError, TypeError):
             continue
 
+    np.savez(cache_path,
+             ids=np.fromiter(existing_ids, dtype=np.int64, count=len(existing_ids)),
+             fingerprint=np.array([str(value) for value in fingerprint]))
     return existing_ids
 
 
 def load_book_content(book_id):
-    """Reads book content from disk."""
+    """Reads book content from disk (one unbuffered read, decoded once)."""
     file_path = os.path.join(config.PATHS["books"], f"{book_id}.txt")
-    if not os.path.exists(file_path):
-        return ""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except IOError:
+        with open(file_path, "rb", buffering=0) as f:
+            return f.read().decode("utf-8")
+    except IOError:  # Includes a missing file
         return ""
 
 
 def create_doc(meta, content):
-    """Helper to create a document dictionary."""
-    return {
-        "_index": config.ELASTIC["index_name"],
-        "_id": meta.get("id"),
-        "_source": {
-            "gutenberg_id": meta.get("id"),
-            "title": meta.get("title"),
-            "author": meta.get("author"),
-            "image_url": meta.get("image_url"),
-            "content": content
-        }
+    """
+    Encodes a book as its two NDJSON bulk lines (action, source),
+    ready to be sent as is.
+    """
+    action = {"index": {"_index": config.ELASTIC["index_name"], "_id": meta.get("id")}}
+    source = {
+        "gutenberg_id": meta.get("id"),
+        "title": meta.get("title"),
+        "author": meta.get("author"),
+        "image_url": meta.get("image_url"),
+        "content": content
     }
+    # OPT_APPEND_NEWLINE: no extra copy of the content just to add "\n"
+    return (orjson.dumps(action, option=orjson.OPT_APPEND_NEWLINE),
+            orjson.dumps(source, option=orjson.OPT_APPEND_NEWLINE))
 
 
-def worker_index_batch(books_subset):
+def generate_book_docs(books):
+    """
+    Yields the encoded bulk lines of books in order. Up to PREFETCH_BOOKS
+    files are read ahead by PREFETCH_THREADS threads, so disk reads overlap
+    with the bulk requests consuming this generator.
     """
-    Worker function: Indexes a batch of books.
-    Each worker creates its own ES client connection.
+    with ThreadPoolExecutor(max_workers=PREFETCH_THREADS) as reader:
+        pending = deque()
+        books = iter(books)
+        for meta in islice(books, PREFETCH_BOOKS):
+            pending.append((meta, reader.submit(load_book_content, meta.get("id"))))
+
+        while pending:
+            meta, future = pending.popleft()
+            for next_meta in islice(books, 1):
+                pending.append((next_meta, reader.submit(load_book_content,
+                                                         next_meta.get("id"))))
+            content = future.result()
+            if content:
+                yield create_doc(meta, content)
+
+
+def generate_bulk_bodies(books, chunk_size):
     """
-    # Create a dedicated client for this process
-    es = Elasticsearch(
+    Groups the encoded books into NDJSON bodies of chunk_size books, cut
+    earlier once a body would exceed ELASTIC['bulk_max_bytes'].
+    Lines are appended to one scratch buffer reused for every body; each body
+    is snapshotted to bytes since the senders still hold it while the next fills.
+    """
+    max_bytes = config.ELASTIC["bulk_max_bytes"]
+    body = bytearray()
+    count = 0
+    for action, source in generate_book_docs(books):
+        doc_size = len(action) + len(source)
+        if doc_size > max_bytes:
+            book_id = orjson.loads(action)["index"]["_id"]
+            logger.error(f"Book {book_id} skipped: {doc_size} bytes exceeds "
+                         f"the {max_bytes} bytes bulk limit.")
+            continue
+        if count and len(body) + doc_size > max_bytes:
+            yield bytes(body)
+            body.clear()
+            count = 0
+        body += action
+        body += source
+        count += 1
+        if count == chunk_size:
+            yield bytes(body)
+            body.clear()
+            count = 0
+    if count:
+        yield bytes(body)
+
+
+def send_bulk_body(client, body):
+    """
+    Posts one preformatted bulk body. Returns (success, failed) counts.
+    Items rejected with 429 (indexing pressure) are re-sent with exponential
+    backoff, like helpers.streaming_bulk does; other item errors are logged.
+    """
+    success = failed = 0
+    delay = config.ELASTIC["bulk_backoff"]
+    for attempt in range(config.ELASTIC["bulk_max_retries"] + 1):
+        items = client.bulk(operations=body)["items"]
+        lines = None
+        retry_lines = []
+        first_error = None
+        for i, item in enumerate(items):
+            result = next(iter(item.values()))
+            if result["status"] < 300:
+                success += 1
+            elif result["status"] == 429 and attempt < config.ELASTIC["bulk_max_retries"]:
+                # Item i is the (action, source) line pair 2i, 2i+1
+                if lines is None:
+                    lines = body.split(b"\n")
+                retry_lines += lines[2 * i:2 * i + 2]
+            else:
+                failed += 1
+                first_error = first_error or result
+        if first_error is not None:
+            logger.error(f"Bulk item {first_error.get('_id')} failed "
+                         f"({first_error['status']}): {first_error.get('error')}")
+        if not retry_lines:
+            break
+        logger.warning(f"{len(retry_lines) // 2} bulk items rejected (429), "
+                       f"retrying in {delay}s...")
+        time.sleep(delay)
+        delay *= 2
+        body = b"\n".join(retry_lines) + b"\n"
+    return success, failed
+
+
+def create_client():
+    """
+    Client shared by the bulk threads, with a keep-alive connection pool.
+    Bodies are gzipped on the wire (book text compresses ~3x).
+    """
+    return Elasticsearch(
         hosts=[config.ELASTIC["host"]],
-        request_timeout=config.ELASTIC["timeout"]
+        request_timeout=config.ELASTIC["bulk_timeout"],
+        connections_per_node=config.ELASTIC["pool_size"],
+        http_compress=True
     )
 
-    docs = []
-    for meta in books_subset:
-        book_id = meta.get("id")
-        content = load_book_content(book_id)
-
-        if not content:
-            continue
 
-        docs.append(create_doc(meta, content))
+@contextmanager
+def bulk_load_settings(client, cold):
+    """
+    Disables the periodic refresh during the bulk load (and fsync per request
+    when the index starts empty), then restores the defaults and refreshes once.
+    """
+    index_name = config.ELASTIC["index_name"]
+    load_settings = {"refresh_interval": "-1"}
+    if cold:
+        load_settings["translog.durability"] = "async"
 
-    if docs:
-        # Bulk insert this batch
-        success, failed = bulk(
-            es,
-            docs,
-            stats_only=True,
-            chunk_size=config.ELASTIC["bulk_chunk_size"]
+    client.indices.put_settings(index=index_name, settings={"index": load_settings})
+    try:
+        yield
+    finally:
+        # None resets each setting to the index default
+        client.indices.put_settings(
+            index=index_name,
+            settings={"index": {key: None for key in load_settings}}
         )
-        return success, failed
-    return 0, 0
+        client.indices.refresh(index=index_name)
 
 
-def run_indexing():
-    """Main indexing routine with parallelism."""
+def run_indexing(workers=None, chunk_size=None, full=False):
+    """
+    Main indexing routine with parallelism.
+    full: re-index every book instead of only those missing from the index.
+    """
     # 1. Setup
     init_elasticsearch()
-    es = Elasticsearch(hosts=[config.ELASTIC["host"]])
+    es = create_client()
 
     metadata_file = config.PATHS["metadata"]
     if not os.path.exists(metadata_file):
@@ -140,10 +296,13 @@ def run_indexing():
         return
 
     # 2. Load Metadata & Check Existing
-    with open(metadata_file, "r", encoding="utf-8") as f:
-        all_books = json.load(f)
+    with open(metadata_file, "rb") as f:
+        all_books = orjson.loads(f.read())
 
-    indexed_ids = get_indexed_ids(es)
+    fingerprint = index_fingerprint(es)
+    # Cold load: the index is really empty (not just skipped by --full)
+    cold = fingerprint is None or fingerprint[1] == 0
+    indexed_ids = set() if full else get_indexed_ids(es, fingerprint)
     logger.info(f"Found {len(indexed_ids)} books already indexed.")
 
     new_books = [b for b in all_books if b.get('id') not in indexed_ids]
@@ -154,29 +313,47 @@ def run_indexing():
 
     logger.info(f"Starting parallel indexing for {len(new_books)} new books...")
 
-    # 3. Parallel Execution
-    workers = config.WORKERS.io_intensive
-
-    num_chunks = workers * 2
-    if len(new_books) < num_chunks:
-        num_chunks = 1
-
-    chunks = np.array_split(new_books, num_chunks)
-
-    logger.info(f"Dispatching to {workers} workers (processing {num_chunks} batches)...")
+    # 3. Parallel Execution (I/O bound: threads sharing one client)
+    workers = workers or config.WORKERS.mixed
+    chunk_size = chunk_size or config.ELASTIC["bulk_chunk_size"]
+    logger.info(f"Dispatching to {workers} bulk threads...")
 
     total_success = 0
     total_failed = 0
 
-    with Pool(processes=workers) as pool:
-        results = pool.map(worker_index_batch, chunks)
+    # Reading stays at most max_in_flight bodies ahead of the uploads
+    max_in_flight = workers * config.ELASTIC["bulk_pipeline"]
+
+    with bulk_load_settings(es, cold=cold), \
+            ThreadPoolExecutor(max_workers=workers) as senders:
+        in_flight = deque()
+        for body in generate_bulk_bodies(new_books, chunk_size):
+            if len(in_flight) >= max_in_flight:
+                s, f = in_flight.popleft().result()
+                total_success += s
+                total_failed += f
+            in_flight.append(senders.submit(send_bulk_body, es, body))
 
-    for s, f in results:
-        total_success += s
-        total_failed += f
+        for future in in_flight:
+            s, f = future.result()
+            total_success += s
+            total_failed += f
 
     logger.info(f"Indexing finished. Success: {total_success}, Failed: {total_failed}")
 
 
+def main(workers=None, chunk_size=None, full=False):
+    """Indexes every downloaded book that is not in Elasticsearch yet."""
+    run_indexing(workers=workers, chunk_size=chunk_size, full=full)
+
+
 if __name__ == "__main__":
-    run_indexing()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexes the downloaded books into Elasticsearch.")
+    parser.add_argument("--workers", type=int,
+                        help="Bulk threads (default: WORKERS.mixed)")
+    parser.add_argument("--chunk-size", type=int,
+                        help="Books per bulk request (default: ELASTIC['bulk_chunk_size'])")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-index every book instead of resuming from the indexed IDs")
+    args = parser.parse_args()
+    main(workers=args.workers, chunk_size=args.chunk_size, full=args.full)
\ No newline at end of file